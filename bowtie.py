@@ -6,12 +6,14 @@ analysis of a response function of a particle instrument.
 __author__ = "Philipp Oleynik"
 __credits__ = ["Philipp Oleynik"]
 
-import math
-from scipy import interpolate
-from scipy import optimize
-from statistics import geometric_mean
+from functools import lru_cache
 import numpy as np
 
+import bowtie_core
+
+# The grid entries the logarithms of the energies are calculated from, see _get_log_energies.
+_LOG_ENERGY_SOURCES = { 'logmid': 'midpt', 'loglow': 'enlow' }
+
 
 def make_energy_grid(*, channels_per_decade = 256, min_energy = 0.01, max_energy = 1.0E5):
     """
@@ -20,41 +22,65 @@ def make_energy_grid(*, channels_per_decade = 256, min_energy = 0.01, max_energy
     :param min_energy: Starting energy. Can be anything, not necessarily powers of 10
     :param max_energy: Upper limit of energy. Can be anything, not necessarily powers of 10
     :return: An integer and three float arrays: number_of_energy_steps, energy_midpoint, energy_cut, energy_bin_width
-            The cuts are the upper limits.
+            The cuts are the upper limits. The grid also carries the trapezoidal integration weights over
+            the midpoints ('trapw'), see fold_spectrum_np, and the natural logarithms of the midpoints ('logmid')
+            and of the lower bin limits ('loglow') for the power-law spectra.
     """
     emin_start = (np.floor(np.log10(min_energy) * channels_per_decade) / channels_per_decade)
     emax_stop = (np.floor(np.log10(max_energy) * channels_per_decade) / channels_per_decade)
     number_of_energy_steps = int((emax_stop - emin_start) * channels_per_decade + 1)
     log_step = 1.0 / channels_per_decade
     
-    energy_midpoint = np.zeros(shape = (number_of_energy_steps,), dtype = float)
-    energy_cut = np.zeros(shape = (number_of_energy_steps,), dtype = float)
-    energy_low = np.zeros(shape = (number_of_energy_steps,), dtype = float)
-    energy_bin_width = np.zeros(shape = (number_of_energy_steps,), dtype = float)
+    base_energy = np.power(10, emin_start)
+    bin_index = np.arange(number_of_energy_steps, dtype = float)
     
-    for i in range(0, number_of_energy_steps, 1):
-        midpoint = np.power(10, emin_start) * np.power(10, log_step * (i + 0.5))
-        energy_bin_low = np.power(10, emin_start) * np.power(10, log_step * i)
-        energy_bin_high = np.power(10, emin_start) * np.power(10, log_step * (i + 1))
-        
-        energy_cut[i] = energy_bin_high
-        energy_midpoint[i] = midpoint
-        energy_bin_width[i] = energy_bin_high - energy_bin_low
-        energy_low[i] = energy_bin_low
+    energy_low = base_energy * np.power(10, log_step * bin_index)
+    energy_cut = base_energy * np.power(10, log_step * (bin_index + 1))
+    energy_midpoint = base_energy * np.power(10, log_step * (bin_index + 0.5))
+    energy_bin_width = energy_cut - energy_low
     
     return { 'nstep': number_of_energy_steps,
              'midpt': energy_midpoint,
              'ehigh': energy_cut,
              'enlow': energy_low,
-             'binwd': energy_bin_width }
+             'binwd': energy_bin_width,
+             'trapw': trapezoid_weights(energy_midpoint),
+             'logmid': np.log(energy_midpoint),
+             'loglow': np.log(energy_low) }
+
+
+@lru_cache(maxsize = 8)
+def _cached_gammas(gamma_pow_min, gamma_pow_max, num_steps):
+    """
+    Returns the power-law indices of the model spectra. The drivers request the same indices for every channel,
+    so the array is cached; it is read-only since it is shared between the calls.
+    :return: num_steps indices from gamma_pow_min to gamma_pow_max as a numpy array.
+    """
+    gammas = np.linspace(gamma_pow_min, gamma_pow_max, num = num_steps, endpoint = True)
+    gammas.flags.writeable = False
+    return gammas
+
+
+def _get_log_energies(energy_grid, log_key):
+    """
+    Returns the natural logarithm of the midpoints ('logmid') or the lower limits ('loglow') of an energy grid.
+    Grids without the entry get it calculated and stored, so that it is calculated only once per grid.
+    :param energy_grid: the energy_grid_data (dictionary, see make_energy_grid)
+    :param log_key: 'logmid' or 'loglow'
+    :return: the logarithms as numpy array.
+    """
+    if log_key not in energy_grid:
+        energy_grid[log_key] = np.log(energy_grid[_LOG_ENERGY_SOURCES[log_key]])
+    return energy_grid[log_key]
 
 
 def generate_pwlaw_spectra(energy_grid_dict,
                            gamma_pow_min = -3.5, gamma_pow_max = -1.5,
-                           num_steps = 100, use_integral_bowtie = False):
+                           num_steps = 100, use_integral_bowtie = False,
+                           dtype = np.float64):
     """
     The function generates a power-law spectra in a given range of indices.
-    :param energy_grid_dict: A dictionary, must have 'midpt' (a numpy array)
+    :param energy_grid_dict: A dictionary, must have 'midpt' and, for the integral spectra, 'enlow' (numpy arrays)
     :type energy_grid_dict: the energy_grid_data (dictionary, see make_energy_grid),
     :param gamma_pow_min: The lower limit for power-law index
     :type gamma_pow_min: float
@@ -64,31 +90,38 @@ def generate_pwlaw_spectra(energy_grid_dict,
     :type num_steps: int
     :param use_integral_bowtie: True if integral spectrum is requested
     :type use_integral_bowtie: bool
-    :return: A list of dictionaries containing the power-law spectra.
-    :rtype: a list of dictionaries with float 'gamma' field and an array with a spectrum as 'spect' field.
+    :param dtype: The floating point type of the spectra, see calculate_bowtie_gf.
+    :type dtype: numpy dtype
+    :return: A dictionary containing the power-law spectra.
+    :rtype: a dictionary with an array of the power-law indices as 'gamma' field, a (num_steps, nstep) array
+            with a spectrum per row as 'spect' field, and, if requested, the integral spectra as 'intsp' field.
+            The mean of the logarithm of the spectra over the indices is given for each energy bin
+            as 'spect_meanlog' (and 'intsp_meanlog'), see calculate_bowtie_gf.
     """
-    model_spectra = []  # generate power-law spectra for folding
+    gammas = _cached_gammas(gamma_pow_min, gamma_pow_max, num_steps)
+    # All spectra at once: a row per power-law index, a column per energy bin. E^gamma = exp(gamma * ln E)
+    # with the precomputed logarithms is cheaper than a power function.
+    log_midpoints = _get_log_energies(energy_grid_dict, 'logmid')
+    spectra = np.exp(gammas[:, np.newaxis] * log_midpoints[np.newaxis, :]).astype(dtype, copy = False)
+    # ln S = gamma * ln E, so the mean over the indices is mean(gamma) * ln E.
+    model_spectra = { 'gamma': gammas, 'spect': spectra,
+                      'spect_meanlog': (np.mean(gammas) * log_midpoints).astype(dtype, copy = False) }
     if use_integral_bowtie:
-        for power_law_gamma in np.linspace(gamma_pow_min, gamma_pow_max, num = num_steps, endpoint = True):
-            model_spectra.append({
-                'gamma': power_law_gamma,
-                'spect': generate_powerlaw_np(energy_grid = energy_grid_dict, power_index = power_law_gamma),
-                'intsp': generate_integral_powerlaw_np(energy_grid = energy_grid_dict,
-                                                       power_index = power_law_gamma)
-            })
-    else:
-        for power_law_gamma in np.linspace(gamma_pow_min, gamma_pow_max, num = num_steps, endpoint = True):
-            model_spectra.append({
-                'gamma': power_law_gamma,
-                'spect': generate_powerlaw_np(energy_grid = energy_grid_dict, power_index = power_law_gamma)
-            })
+        log_low = _get_log_energies(energy_grid_dict, 'loglow')
+        integral_spectra = - np.exp((gammas[:, np.newaxis] + 1) * log_low[np.newaxis, :]) / \
+                           (gammas[:, np.newaxis] + 1)
+        model_spectra['intsp'] = integral_spectra.astype(dtype, copy = False)
+        # ln S = (gamma + 1) * ln E - ln(-(gamma + 1))
+        model_spectra['intsp_meanlog'] = (np.mean(gammas + 1) * log_low -
+                                          np.mean(np.log(-(gammas + 1)))).astype(dtype, copy = False)
+    
     return model_spectra
 
 
 def generate_exppowlaw_spectra(energy_grid_dict,
                                gamma_pow_min = -3.5, gamma_pow_max = -1.5,
                                num_steps = 100, use_integral_bowtie = False,
-                               cutoff_energy = 1.0):
+                               cutoff_energy = 1.0, dtype = np.float64):
     """
     The function generates exponentially cut off power-law spectra in a given range of indices.
     The exponential cutoff is applied by the formula dJ/dE = E^(gamma) * exp( - E0 / (E - E0)); E > E0
@@ -104,39 +137,53 @@ def generate_exppowlaw_spectra(energy_grid_dict,
     :type use_integral_bowtie: bool
     :param cutoff_energy: The lower cutoff energy; E0 in the formula
     :type cutoff_energy: float
-    :return: A list of dictionaries containing the exponentially cut off power-law spectra.
-    :rtype: a list of dictionaries with float 'gamma' field and an array with a spectrum as 'spect' field.
+    :param dtype: The floating point type of the spectra, see calculate_bowtie_gf.
+    :type dtype: numpy dtype
+    :return: A dictionary containing the exponentially cut off power-law spectra.
+    :rtype: a dictionary with an array of the power-law indices as 'gamma' field
+            and a (num_steps, nstep) array with a spectrum per row as 'spect' field.
+            The mean of the logarithm of the spectra over the indices is given for each energy bin
+            as 'spect_meanlog', see calculate_bowtie_gf.
     """
-    model_spectra = []
     if use_integral_bowtie:
         print("Not implemented!")
         return None
     
-    for power_law_gamma in np.linspace(gamma_pow_min, gamma_pow_max, num = num_steps, endpoint = True):
-        spectrum = 1.0 * np.power(energy_grid_dict['midpt'], power_law_gamma) * \
-                   np.exp(-cutoff_energy / (energy_grid_dict['midpt'] - cutoff_energy))
-        
-        index_cutoff = np.searchsorted(energy_grid_dict['midpt'], cutoff_energy)
-        np.put(spectrum, range(0, index_cutoff + 1), 1.0E-30)
-        model_spectra.append({
-            'gamma': power_law_gamma,
-            'spect': spectrum
-        })
-    return model_spectra
+    gammas = _cached_gammas(gamma_pow_min, gamma_pow_max, num_steps)
+    index_cutoff = np.searchsorted(energy_grid_dict['midpt'], cutoff_energy)
+    # E^gamma * exp(-E0 / (E - E0)) = exp(gamma * ln E - E0 / (E - E0)), so a single exp gives the spectra.
+    # The cutoff exponent is only needed above E0, the spectra below are replaced by a floor value.
+    above_cutoff = energy_grid_dict['midpt'][index_cutoff + 1:]
+    cutoff_exponent = np.zeros_like(energy_grid_dict['midpt'])
+    cutoff_exponent[index_cutoff + 1:] = -cutoff_energy / (above_cutoff - cutoff_energy)
+    log_midpoints = _get_log_energies(energy_grid_dict, 'logmid')
+    spectra = np.exp(gammas[:, np.newaxis] * log_midpoints[np.newaxis, :] + cutoff_exponent)
+    spectra[:, :index_cutoff + 1] = 1.0E-30
+    # Just above E0, the cutoff term is far below the floor and underflows to zero in float32,
+    # which would give infinite geometric factors. The spectra are therefore kept at the floor in any dtype.
+    spectra = spectra.astype(dtype, copy = False)
+    np.maximum(spectra, 1.0E-30, out = spectra)
+    mean_log_spectra = np.mean(gammas) * log_midpoints + cutoff_exponent
+    mean_log_spectra[:index_cutoff + 1] = np.log(1.0E-30)
+    # The closed form does not hold in the bins where some of the spectra are raised to the floor.
+    floored_bins = np.nonzero(np.any(spectra[:, index_cutoff + 1:] <= 1.0E-30, axis = 0))[0] + index_cutoff + 1
+    mean_log_spectra[floored_bins] = np.mean(np.log(spectra[:, floored_bins], dtype = np.float64), axis = 0)
+    return { 'gamma': gammas, 'spect': spectra,
+             'spect_meanlog': mean_log_spectra.astype(dtype, copy = False) }
 
 
 def generate_integral_powerlaw_np(*, energy_grid = None,
                                   power_index = -3.5, sp_norm = 1.0):
     """
     The function generates a single power-law integral spectrum.
-    :param energy_grid_dict: A dictionary, must have 'midpt' (a numpy array)
+    :param energy_grid_dict: A dictionary, must have 'enlow' (a numpy array)
     :type energy_grid_dict: the energy_grid_data (dictionary, see make_energy_grid),
     :param power_index: power-law index.
     :param sp_norm: norm factor.
     :return: spectrum as numpy array.
     """
     if energy_grid is not None:
-        spectrum = - sp_norm * np.power(energy_grid['enlow'], power_index + 1) / (power_index + 1)
+        spectrum = - sp_norm * np.exp((power_index + 1) * _get_log_energies(energy_grid, 'loglow')) / (power_index + 1)
         return spectrum
     return None
 
@@ -150,26 +197,101 @@ def generate_powerlaw_np(*, energy_grid = None, power_index = -2, sp_norm = 1.0)
     :param sp_norm: norm factor.
     :return: spectrum as numpy array.
     """
-    spectrum = sp_norm * np.power(energy_grid['midpt'], power_index)
+    spectrum = sp_norm * np.exp(power_index * _get_log_energies(energy_grid, 'logmid'))
     return spectrum
 
 
-def fold_spectrum_np(*, grid = None, spectrum = None, response = None):
+def trapezoid_weights(grid_points):
+    """
+    Calculates the weights of the trapezoidal rule, so that np.dot(values, weights) == np.trapz(values, grid_points).
+    :param grid_points: the points the integrand is defined at, e.g. midpoints of the energy bins
+    :return: the weights as numpy array of the same length as grid_points.
+    """
+    weights = np.empty_like(grid_points, dtype = float)
+    weights[1:-1] = (grid_points[2:] - grid_points[:-2]) * 0.5
+    weights[0] = (grid_points[1] - grid_points[0]) * 0.5
+    weights[-1] = (grid_points[-1] - grid_points[-2]) * 0.5
+    return weights
+
+
+def _get_trapezoid_weights(energy_grid):
+    """
+    Returns the trapezoidal weights of an energy grid. Grids without a 'trapw' entry get the weights calculated
+    and stored as 'trapw', so that the channels sharing the grid do not recalculate them.
+    :param energy_grid: the energy_grid_data (dictionary, see make_energy_grid)
+    :return: the weights as numpy array.
+    """
+    if 'trapw' not in energy_grid:
+        energy_grid['trapw'] = trapezoid_weights(energy_grid['midpt'])
+    return energy_grid['trapw']
+
+
+def _get_mean_log_spectrum(model_spectra, spectrum_key, spectrum_data, index_emin, index_emax):
+    """
+    Returns the mean of the logarithm of the model spectra for each energy bin.
+    It does not depend on the channel response, so the spectrum generators provide it as spectrum_key + '_meanlog'.
+    The provided values are checked against spectrum_data in the first and the last energy bin of the band,
+    which detects a normalization of the spectra after they were generated. For model spectra without this entry,
+    or if the check fails, it is calculated from spectrum_data.
+    :param model_spectra: The model spectra (dictionary, see generate_pwlaw_spectra)
+    :param spectrum_key: 'spect' for the differential or 'intsp' for the integral spectra
+    :param spectrum_data: model_spectra[spectrum_key] in the dtype of the analysis
+    :param index_emin: The index of the first energy bin of the band.
+    :param index_emax: The index after the last energy bin of the band.
+    :return: the mean logarithm as numpy array of length nstep.
+    """
+    mean_log_spectrum = model_spectra.get(spectrum_key + '_meanlog')
+    if mean_log_spectrum is not None:
+        band_ends = [index_emin, index_emax - 1]
+        expected = np.mean(np.log(spectrum_data[:, band_ends], dtype = np.float64), axis = 0)
+        if np.allclose(mean_log_spectrum[band_ends], expected, rtol = 1.0E-6, atol = 1.0E-6):
+            return mean_log_spectrum
+    return np.mean(np.log(spectrum_data), axis = 0)
+
+
+def _check_grid_lengths(grid, *arrays):
+    """
+    Checks that the arrays are defined on the energy grid, i.e. their last dimension is the number of energy bins.
+    :param grid: the energy_grid_data (dictionary, see make_energy_grid)
+    :param arrays: the spectra or responses to check
+    :raises ValueError: if an array does not match the grid.
+    """
+    nstep = len(grid['midpt'])
+    for array in arrays:
+        if np.shape(array)[-1] != nstep:
+            raise ValueError(f"An array of shape {np.shape(array)} does not match the energy grid of {nstep} bins.")
+
+
+def fold_spectrum_np(*, grid, spectrum, response):
     """
     Folds incident spectrum with an instrument response. Int( spectrum * response * dE)
+    This is a convenience function for a single spectrum; calculate_bowtie_gf folds all model spectra at once.
     :param grid: energy grid, midpoints of each energy bin
     :param spectrum: intensities defined at the midpoint of each energy bin
     :param response: geometric factor curve defined at the midpoint of each energy bin
     :return: countrate in the channel described by the response.
+    :rtype: float
+    :raises ValueError: if the spectrum or the response does not match the grid.
+    """
+    _check_grid_lengths(grid, spectrum, response)
+    return float(np.dot(np.multiply(spectrum, response), _get_trapezoid_weights(grid)))
+
+
+def _linear_interpolation_root(x_points, y_points, nearest_to_end = False):
     """
-    if grid is None:
-        return math.nan
-    if spectrum is None or response is None:
+    Finds a root of the piecewise-linear interpolation of y_points defined at x_points.
+    :param x_points: the points the function is defined at, in ascending order
+    :param y_points: the values of the function
+    :param nearest_to_end: True if the root nearest to the end of x_points is requested,
+                           otherwise the root nearest to the start is returned.
+    :return: the root, or 0 if the function does not change its sign.
+    """
+    signs = np.sign(y_points)
+    sign_changes = np.nonzero((signs[:-1] * signs[1:] <= 0) & ((signs[:-1] != 0) | (signs[1:] != 0)))[0]
+    if len(sign_changes) == 0:
         return 0
-    if (len(spectrum) == len(response)) and (len(spectrum) == len(grid['midpt'])):
-        result = np.trapz(np.multiply(spectrum, response), grid['midpt'])
-        return result
-    return 0
+    k = sign_changes[-1] if nearest_to_end else sign_changes[0]
+    return x_points[k] - y_points[k] * (x_points[k + 1] - x_points[k]) / (y_points[k + 1] - y_points[k])
 
 
 def calculate_bowtie_gf(response_data,
@@ -178,7 +300,8 @@ def calculate_bowtie_gf(response_data,
                         gamma_index_steps = 100,
                         use_integral_bowtie = False,
                         sigma = 3,
-                        return_gf_stddev = False):
+                        return_gf_stddev = False,
+                        dtype = np.float64):
     """
     Calculates the bowtie geometric factor for a single channel
     :param return_gf_stddev: True if the margin of the channel geometric factor is requested.
@@ -187,75 +310,91 @@ def calculate_bowtie_gf(response_data,
     :type response_data: A dictionary, must have 'grid', the energy_grid_data (dictionary, see make_energy_grid),
                          and 'resp', the channel response (an array of a length of energy_grid_data['nstep'])
     :param model_spectra: The model spectra for the analysis.
-    :type model_spectra: A dictionary (see generate_pwlaw_spectra)
+    :type model_spectra: A dictionary (see generate_pwlaw_spectra). The mean logarithm of the spectra provided by
+                         the generators is used only if it agrees with the spectra, see _get_mean_log_spectrum.
     :param emin: the minimal energy to consider
     :type emin: float
     :param emax: the maximum energy to consider
     :type emax: float
-    :param gamma_index_steps:
-    :type gamma_index_steps:
+    :param gamma_index_steps: The number of model spectra, must match model_spectra.
+    :type gamma_index_steps: int
     :param use_integral_bowtie:
     :type use_integral_bowtie:
     :param sigma: Cutoff sigma value for the energy margin.
     :type sigma: float
+    :param dtype: The floating point type the model spectra and the geometric factors are processed in.
+                  np.float32 halves the memory traffic of the analysis. Generate the model spectra
+                  with the same dtype, otherwise they are converted on each call. The results are returned as float64.
+                  np.float32 covers only the values from about 1e-38 to 3e38: smaller spectrum values underflow
+                  to zero, and the geometric factors in the bins where the spectra are that small overflow
+                  (generate_exppowlaw_spectra keeps its spectra at the 1e-30 floor for this reason).
+                  Such bins get an infinite standard deviation and never become the crossing point.
+    :type dtype: numpy dtype
     :return: (The geometric factor, [the standard dev of GF], the effective energy, lower margin for the effective energy, upper margin for the effective energy)
     :rtype: list
+    :raises ValueError: if the response or the model spectra do not match the energy grid or gamma_index_steps,
+                        if there are no energy bins between emin and emax, if the folded count rate
+                        is not positive for all model spectra, e.g. for a dead channel,
+                        or if the geometric factors are not finite in any of the energy bins.
     """
-    energy_grid_local = response_data['grid']['midpt']
+    energy_grid = response_data['grid']
+    response = response_data['resp']
+    energy_grid_local = energy_grid['midpt']
+    
+    # search for the indices corresponding to the start and stop energies
+    index_emin, index_emax = np.searchsorted(energy_grid_local, [emin, emax])
+    spectra = np.asarray(model_spectra['spect'], dtype = dtype)
+    spectrum_key = 'intsp' if use_integral_bowtie else 'spect'
+    spectrum_data = spectra if spectrum_key == 'spect' else np.asarray(model_spectra[spectrum_key], dtype = dtype)
+    _check_grid_lengths(energy_grid, response, spectra, spectrum_data)
+    for key in ('spect', spectrum_key):
+        if len(model_spectra[key]) != gamma_index_steps:
+            raise ValueError(f"Expected {gamma_index_steps} model spectra, got {len(model_spectra[key])} in '{key}'.")
     
-    index_emin = np.searchsorted(energy_grid_local, emin)  # search for an index corresponding to start energy
-    index_emax = np.searchsorted(energy_grid_local, emax)
-    multi_geometric_factors = np.zeros((gamma_index_steps, response_data['grid']['nstep']), dtype = float)
-    # for each model spectrum do the folding.
+    if index_emin >= index_emax:
+        raise ValueError(f"No energy bins between emin = {emin} and emax = {emax}.")
+    mean_log_spectrum_data = np.asarray(_get_mean_log_spectrum(model_spectra, spectrum_key, spectrum_data,
+                                                               index_emin, index_emax), dtype = dtype)
     
-    for model_spectrum_idx, model_spectrum in enumerate(model_spectra):
-        
-        spectral_folding_int = fold_spectrum_np(grid = response_data['grid'],
-                                                spectrum = model_spectrum['spect'],
-                                                response = response_data['resp'])
-        if use_integral_bowtie:
-            spectrum_data = model_spectrum['intsp']
-        else:
-            spectrum_data = model_spectrum['spect']
-        
-        multi_geometric_factors[model_spectrum_idx, index_emin:index_emax] = spectral_folding_int / spectrum_data[index_emin:index_emax]
+    # Fold all model spectra at once. The trapezoidal integral over the grid is a dot product
+    # with the trapezoidal weights, so the response is weighted once for all model spectra.
+    response_weighted = np.asarray(response * _get_trapezoid_weights(energy_grid), dtype = dtype)
+    spectral_folding_int = spectra @ response_weighted
+    if not np.all(spectral_folding_int > 0):
+        raise ValueError("The channel response gives no positive count rate for some model spectra.")
     
     # Create a discrete standard deviation vector for each energy in the grid.
     # This standard deviation is normalized to the local mean, so that a measure of spreading of points is obtained.
     # Mathematically, this implies normalization of the random variable to its mean.
-    non_zero_gf = np.mean(multi_geometric_factors, axis = 0) > 0
-    multi_geometric_factors_usable = multi_geometric_factors[:, non_zero_gf]
-    means = np.exp(np.mean(np.log(multi_geometric_factors_usable), axis = 0))  # logarithmic mean
-    gf_stddev = np.std(multi_geometric_factors_usable, axis = 0) / means
-    gf_stddev_norm = gf_stddev / np.min(gf_stddev)
-    bowtie_cross_index = np.argmin(gf_stddev_norm)  # The minimal standard deviation point - bowtie crossing point.
+    means, gf_stddev = bowtie_core.bowtie_core(spectral_folding_int, spectrum_data, mean_log_spectrum_data,
+                                               index_emin, index_emax)
+    # A spectrum value that is zero or too small for dtype gives a non-finite standard deviation.
+    # Such energy bins are treated as infinitely spread, so they never become the crossing point.
+    gf_stddev = np.asarray(gf_stddev, dtype = np.float64)
+    gf_stddev[~np.isfinite(gf_stddev)] = np.inf
+    bowtie_cross_index = np.argmin(gf_stddev)  # The minimal standard deviation point - bowtie crossing point.
+    if not np.isfinite(gf_stddev[bowtie_cross_index]):
+        raise ValueError(f"The geometric factors are not finite in any energy bin between emin = {emin} and emax = {emax}.")
+    gf_stddev_norm = gf_stddev / gf_stddev[bowtie_cross_index]
     
-    # Interpolate the discrete standard deviation so that it could be used in a equation solver.
     # The discrete standard deviation is normalized to 1 in the minimum, so that 1.0 must be subtracted
-    # before sigma level to make a discrete "equation" for the the interpolator because
-    # the optimize.bisect looks for zeroes of a function, which is the interpolator.
-    stddev_interpolator = interpolate.interp1d(energy_grid_local[non_zero_gf], gf_stddev_norm - 1.0 - sigma)
-    try:
-        (channel_energy_low) = optimize.bisect(stddev_interpolator,
-                                               energy_grid_local[non_zero_gf][0],
-                                               energy_grid_local[non_zero_gf][bowtie_cross_index])  # to the left of bowtie_cross_index
-    except ValueError:
-        channel_energy_low = 0
-    
-    try:
-        (channel_energy_high) = optimize.bisect(stddev_interpolator,
-                                                energy_grid_local[non_zero_gf][bowtie_cross_index],
-                                                energy_grid_local[non_zero_gf][-1])  # to the right of bowtie_cross_index
-    except ValueError:
-        channel_energy_high = 0
-    
-    # gf = np.mean(multi_geometric_factors_usable, axis = 0)  # Average geometric factor for all model spectra
-    # gf_cross = gf[bowtie_cross_index]  # The mean geometric factor for the bowtie crossing point
+    # before sigma level to make a discrete "equation". The standard deviation is linearly interpolated
+    # between the grid points, so the margins are the roots of the piecewise-linear function
+    # that are the nearest to bowtie_cross_index on each side. The infinite values are limited
+    # to the largest float, so that the interpolation next to them stays finite.
+    energy_grid_usable = energy_grid_local[index_emin:index_emax]
+    stddev_level = np.minimum(gf_stddev_norm - 1.0 - sigma, np.finfo(np.float64).max)
+    channel_energy_low = _linear_interpolation_root(energy_grid_usable[:bowtie_cross_index + 1],
+                                                    stddev_level[:bowtie_cross_index + 1],
+                                                    nearest_to_end = True)  # to the left of bowtie_cross_index
+    channel_energy_high = _linear_interpolation_root(energy_grid_usable[bowtie_cross_index:],
+                                                     stddev_level[bowtie_cross_index:],
+                                                     nearest_to_end = False)  # to the right of bowtie_cross_index
     
-    gf_cross = geometric_mean(multi_geometric_factors_usable[:, bowtie_cross_index])
-    energy_cross = energy_grid_local[bowtie_cross_index]
+    gf_cross = np.float64(means[bowtie_cross_index])  # The logarithmic mean of the geometric factors at the bowtie crossing point
+    energy_cross = energy_grid_usable[bowtie_cross_index]
     if return_gf_stddev:
-        return gf_cross, gf_stddev[bowtie_cross_index], energy_cross, channel_energy_low, channel_energy_high
+        return gf_cross, np.float64(gf_stddev[bowtie_cross_index]), energy_cross, channel_energy_low, channel_energy_high
     
     return gf_cross, energy_cross, channel_energy_low, channel_energy_high
 
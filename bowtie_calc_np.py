@@ -2,8 +2,11 @@
 
 import numpy as np
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import bowtie
+import bowtie_core
 
 
 def main(use_integral_bowtie = False,
@@ -45,9 +48,14 @@ def main(use_integral_bowtie = False,
     energy_toppoint = npzfile['energy_Cut']  # high cuts of the energy bins in MeV
     energy_channel_width = npzfile['energy_Width']  # the energy bin widths in MeV
     # energy grid in the format compatible with the output of a function in the bowtie package
+    # The channels are analysed in worker processes, which receive copies of the grid and the model spectra.
+    # Everything derived from them must be calculated here, before the workers start: the trapezoidal weights
+    # ('trapw') are set explicitly, the logarithms of the energies ('logmid') are added by the spectrum generator,
+    # which also returns the mean logarithm of the spectra ('spect_meanlog').
     energy_grid = { 'nstep': nstep, 'midpt': energy_midpoint,
                     'ehigh': energy_toppoint, 'enlow': energy_toppoint - energy_channel_width,
-                    'binwd': energy_channel_width }
+                    'binwd': energy_channel_width,
+                    'trapw': bowtie.trapezoid_weights(energy_midpoint) }
     
     channel_names = ["O", "E1", "E2", "E3", "E4", "E5", "E6", "E7", "P1", "P2", "P3", "P4", "P5", "P6", "P7", "P8", "P9"]
     side = 0
@@ -68,14 +76,21 @@ def main(use_integral_bowtie = False,
     gf_to_print = np.zeros(len(response_matrix))
     eff_energies_to_print = np.zeros(len(response_matrix))
     
-    for channel, response in enumerate(response_matrix):
-        (gf_to_print[channel], eff_energies_to_print[channel], _, _) = bowtie.calculate_bowtie_gf(response,
-                                                                                                  power_law_spectra,
-                                                                                                  emin = global_emin,
-                                                                                                  emax = global_emax,
-                                                                                                  gamma_index_steps = gamma_steps,
-                                                                                                  use_integral_bowtie = use_integral_bowtie,
-                                                                                                  sigma = 3)
+    # The channels are independent and share the energy grid and the model spectra,
+    # so they are analysed in parallel processes. The pool already runs a process per core,
+    # so each worker runs the numba kernel in a single thread instead of a thread per core.
+    analyse_channel = partial(bowtie.calculate_bowtie_gf,
+                              model_spectra = power_law_spectra,
+                              emin = global_emin,
+                              emax = global_emax,
+                              gamma_index_steps = gamma_steps,
+                              use_integral_bowtie = use_integral_bowtie,
+                              sigma = 3)
+    with ProcessPoolExecutor(initializer = bowtie_core.set_num_threads, initargs = (1,)) as executor:
+        channel_results = list(executor.map(analyse_channel, response_matrix))
+    
+    for channel, (response, channel_result) in enumerate(zip(response_matrix, channel_results)):
+        (gf_to_print[channel], eff_energies_to_print[channel], _, _) = channel_result
         print(f"Channel {response['name']}: G = {gf_to_print[channel]:.3g}, cm2srMeV; E = {eff_energies_to_print[channel]:.2g}, MeV")
 
 
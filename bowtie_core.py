@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+The computational kernel of the bow-tie analysis: the statistics of the geometric factors obtained
+for each energy bin from the model spectra folded with a channel response.
+The kernel is compiled with numba if it is installed. Otherwise, an equivalent NumPy implementation is used.
+"""
+__author__ = "Philipp Oleynik"
+__credits__ = ["Philipp Oleynik"]
+
+import numpy as np
+
+try:
+    from numba import njit, prange, set_num_threads as _numba_set_num_threads
+except ImportError:
+    njit = None
+
+# Same as fastmath = True, but NaN and Inf are allowed, since a model spectrum may underflow to zero.
+_FASTMATH_FLAGS = { 'nsz', 'arcp', 'contract', 'afn', 'reassoc' }
+# The number of energy bins processed together by the numba kernel; the accumulators of a block stay in L1 cache.
+_BLOCK_SIZE = 256
+
+
+def _bowtie_core_np(spectral_folding_int, spectrum_data, mean_log_spectrum_data, index_emin, index_emax):
+    """
+    NumPy implementation of bowtie_core.
+    """
+    # In float32, the geometric factors overflow in the bins where the spectra are very small;
+    # the resulting non-finite standard deviations are handled by the caller.
+    with np.errstate(over = 'ignore', divide = 'ignore', invalid = 'ignore'):
+        means = np.exp(np.mean(np.log(spectral_folding_int)) - mean_log_spectrum_data[index_emin:index_emax])
+        
+        # Only the band [index_emin, index_emax) is ever used, so the matrix covers only these energy bins.
+        multi_geometric_factors = spectral_folding_int[:, np.newaxis] / spectrum_data[:, index_emin:index_emax]
+        # The same as np.std. The geometric factors are not needed afterwards,
+        # so the squared deviations overwrite them instead of allocating temporaries.
+        squared_deviations = multi_geometric_factors
+        squared_deviations -= np.mean(multi_geometric_factors, axis = 0)
+        np.square(squared_deviations, out = squared_deviations)
+        gf_stddev = np.sqrt(np.mean(squared_deviations, axis = 0)) / means
+    return means, gf_stddev
+
+
+if njit is not None:
+    @njit(parallel = True, fastmath = _FASTMATH_FLAGS, cache = True)
+    def _bowtie_core_nb(spectral_folding_int, spectrum_data, mean_log_spectrum_data, index_emin, index_emax):
+        """
+        Numba implementation of bowtie_core. The energy band is split into blocks processed in parallel.
+        Within a block, the sums are accumulated in one pass over the model spectra, row by row,
+        so the innermost loop runs over contiguous energy bins and is vectorized by the compiler.
+        The variance is accumulated around the geometric factors of the first model spectrum
+        to avoid the cancellation of a naive one-pass sum of squares.
+        :return: the logarithmic means and the normalized standard deviations
+                 of the geometric factors for the energy bins in [index_emin, index_emax).
+        """
+        num_spectra = spectral_folding_int.shape[0]
+        mean_log_folding = np.mean(np.log(spectral_folding_int))
+        
+        width = index_emax - index_emin
+        means = np.empty(width)
+        gf_stddev = np.empty(width)
+        num_blocks = (width + _BLOCK_SIZE - 1) // _BLOCK_SIZE
+        for block in prange(num_blocks):
+            start = index_emin + block * _BLOCK_SIZE
+            block_size = min(_BLOCK_SIZE, index_emax - start)
+            shift = np.empty(block_size)
+            sum_dev = np.zeros(block_size)
+            sum_sq_dev = np.zeros(block_size)
+            for j in range(block_size):
+                shift[j] = spectral_folding_int[0] / spectrum_data[0, start + j]
+            for k in range(num_spectra):
+                folding = spectral_folding_int[k]
+                for j in range(block_size):
+                    deviation = folding / spectrum_data[k, start + j] - shift[j]
+                    sum_dev[j] += deviation
+                    sum_sq_dev[j] += deviation * deviation
+            for j in range(block_size):
+                mean_dev = sum_dev[j] / num_spectra
+                variance = max(sum_sq_dev[j] / num_spectra - mean_dev * mean_dev, 0.0)
+                i = start - index_emin + j
+                means[i] = np.exp(mean_log_folding - mean_log_spectrum_data[start + j])
+                gf_stddev[i] = np.sqrt(variance) / means[i]
+        return means, gf_stddev
+
+
+def set_num_threads(num_threads):
+    """
+    Limits the number of threads the numba kernel uses in the calling process,
+    e.g. in a worker process of a pool that already runs a process per core. Does nothing without numba.
+    :param num_threads: the number of threads, at least 1.
+    :type num_threads: int
+    """
+    if njit is not None:
+        _numba_set_num_threads(num_threads)
+
+
+def bowtie_core(spectral_folding_int, spectrum_data, mean_log_spectrum_data, index_emin, index_emax):
+    """
+    Calculates the statistics of the geometric factors, the folded counts divided by the spectra.
+    Only the energy bins in [index_emin, index_emax) are considered.
+    The logarithmic mean of the geometric factors F_k / S_kj is exp(mean(ln F_k) - mean(ln S_kj)),
+    where the second term does not depend on the channel and is given as mean_log_spectrum_data.
+    :param spectral_folding_int: The model spectra folded with the channel response, all positive.
+    :type spectral_folding_int: numpy array of length num_spectra
+    :param spectrum_data: The spectra the folded counts are divided by, i.e. the model spectra
+                          or the corresponding integral spectra.
+    :type spectrum_data: numpy array of shape (num_spectra, nstep)
+    :param mean_log_spectrum_data: The mean of the logarithm of spectrum_data over the model spectra.
+    :type mean_log_spectrum_data: numpy array of length nstep
+    :param index_emin: The index of the first energy bin to consider.
+    :type index_emin: int
+    :param index_emax: The index after the last energy bin to consider.
+    :type index_emax: int
+    :return: (the logarithmic mean of the geometric factors, their standard deviation normalized to the mean)
+             for each energy bin in [index_emin, index_emax).
+    :rtype: tuple
+    """
+    if njit is None:
+        return _bowtie_core_np(spectral_folding_int, spectrum_data, mean_log_spectrum_data, index_emin, index_emax)
+    return _bowtie_core_nb(spectral_folding_int, spectrum_data, mean_log_spectrum_data, index_emin, index_emax)
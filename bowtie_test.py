@@ -42,9 +42,9 @@ def gf_test(use_integral_bowtie = False, gamma_min = -3.5, gamma_max = -1.5,
     
     if plotspectrum:
         fig, ax = plt.subplots(1)
-        ax.scatter(energy_grid_data['midpt'], exppower_law_spectra[0]['spect'], s = 0.1, label = 'Side')
-        ax.scatter(energy_grid_data['midpt'], exppower_law_spectra[gamma_steps // 2]['spect'], s = 0.1, label = 'Side')
-        ax.scatter(energy_grid_data['midpt'], exppower_law_spectra[gamma_steps - 1]['spect'], s = 0.1, label = 'Side')
+        ax.scatter(energy_grid_data['midpt'], exppower_law_spectra['spect'][0], s = 0.1, label = 'Side')
+        ax.scatter(energy_grid_data['midpt'], exppower_law_spectra['spect'][gamma_steps // 2], s = 0.1, label = 'Side')
+        ax.scatter(energy_grid_data['midpt'], exppower_law_spectra['spect'][gamma_steps - 1], s = 0.1, label = 'Side')
         ax.set_yscale('log')
         ax.set_xscale('log')
         plt.show()
@@ -52,15 +52,15 @@ def gf_test(use_integral_bowtie = False, gamma_min = -3.5, gamma_max = -1.5,
     response_single_ch = np.zeros_like(energy_grid_data['midpt'])
     emin = 1.5  # test boxcar energies
     emax = 2.0
-    index_emin = np.searchsorted(energy_grid_data['midpt'], emin)  # search for an index corresponding to start energy
-    index_emax = np.searchsorted(energy_grid_data['midpt'], emax)
+    # search for the indices corresponding to the start and stop energies
+    index_emin, index_emax = np.searchsorted(energy_grid_data['midpt'], [emin, emax])
     real_emin = energy_grid_data['enlow'][index_emin]
     real_emax = energy_grid_data['ehigh'][index_emax]
     delta_e = real_emax - real_emin
     if use_integral_bowtie:
-        np.put(response_single_ch, range(index_emin, energy_grid_data['nstep']), 1.0)  # a geometric factor of 1 from emin
+        response_single_ch[index_emin:] = 1.0  # a geometric factor of 1 from emin
     else:
-        np.put(response_single_ch, range(index_emin, index_emax + 1), 1.0 / delta_e)  # a geometric factor of 1 from emin to emax
+        response_single_ch[index_emin:index_emax + 1] = 1.0 / delta_e  # a geometric factor of 1 from emin to emax
     
     response_matrix.append({  # in the real application, the response_matrix is a collection of responses for multiple channels
         'name': 'Test boxcar',  # channel name to print